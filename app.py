@@ -6,19 +6,28 @@ import os
 # Allow OAuth2 over HTTP for local development
 os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
 
-from flask import Flask, render_template, request, redirect, url_for, flash, Response
+from flask import (
+    Flask, render_template, request, redirect, url_for, flash, Response, jsonify,
+    make_response, session
+)
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-import json
+import ijson
+import hashlib
+import time
 import uuid
 import zipfile
 import io
+from collections import deque
+from itertools import chain, islice
 
 import config
-from utils.backup import create_backup, test_connection
+from utils.backup import test_connection
 from utils.gdrive import gdrive_client
+from utils import tasks
 from utils.scheduler import (
     init_scheduler, update_scheduler, load_settings, save_settings,
-    load_routers, load_backup_log, add_log_entry, scheduler
+    load_routers, save_routers, get_router, find_router,
+    load_backup_log, get_last_backups, forget_last_backup, backup_routers, scheduler
 )
 
 # Initialize Flask app
@@ -30,6 +39,12 @@ login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+# Fields every router in a bulk upload must have
+REQUIRED_ROUTER_FIELDS = frozenset(['name', 'ip', 'username', 'password'])
+
+# Part of every page ETag, so a restart or redeploy never serves a stale page
+STARTUP_TOKEN = str(time.time_ns())
+
 
 # Simple User class for Flask-Login
 class User(UserMixin):
@@ -44,19 +59,100 @@ def load_user(user_id):
     return None
 
 
-# Helper functions for router storage
-def save_routers(routers):
-    os.makedirs(os.path.dirname(config.ROUTERS_FILE), exist_ok=True)
-    with open(config.ROUTERS_FILE, 'w') as f:
-        json.dump(routers, f, indent=2)
+def _page_etag(files, *values):
+    """Build an ETag from the modification times of the files a page is rendered from."""
+    parts = [STARTUP_TOKEN, current_user.get_id()]
+    for path in files:
+        try:
+            parts.append(os.stat(path).st_mtime_ns)
+        except FileNotFoundError:
+            parts.append(None)
+    parts.extend(values)
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
 
 
-def get_router_by_id(router_id):
-    routers = load_routers()
-    for router in routers:
-        if router['id'] == router_id:
-            return router
-    return None
+def _conditional_page(etag, render):
+    """
+    Serve a page with an ETag, answering 304 Not Modified without rendering it
+    when the browser already has this version.
+
+    Pages with pending flash messages are always rendered, since the messages are part of the page.
+    """
+    if '_flashes' in session:
+        return render()
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _backup_options(settings):
+    """
+    Get the Google Drive options every backup run needs.
+
+    Returns:
+        tuple: (folder_id, delete_local, gdrive_authorized)
+    """
+    folder_id = settings.get('google_drive_folder_id', '') or None  # Convert empty string to None
+    delete_local = settings.get('delete_local_after_upload', False)
+    return folder_id, delete_local, gdrive_client.is_authorized()
+
+
+def build_backup_context(router_id):
+    """
+    Load everything a single-router backup needs in one go.
+
+    Returns:
+        tuple: (router or None, settings, folder_id, delete_local, gdrive_authorized)
+    """
+    router = get_router(router_id)
+    settings = load_settings()
+    return (router, settings) + _backup_options(settings)
+
+
+def _run_backup_single(router, folder_id, delete_local, gdrive_authorized):
+    """
+    Back up one router and upload it to Google Drive. Runs as a background task.
+
+    Returns:
+        list of (message, category) tuples to show the user
+    """
+    log_entries, _ = backup_routers([router], folder_id, delete_local, gdrive_authorized, 'manual')
+    if not log_entries:
+        return [(f'{router["name"]}: Backup failed', 'error')]
+    log_entry = log_entries[0]
+
+    messages = []
+    if log_entry.get('drive_files'):
+        messages.append((f'{len(log_entry["drive_files"])} file(s) uploaded to Google Drive', 'success'))
+    if log_entry.get('drive_errors'):
+        messages.append((f'Some uploads failed: {log_entry["drive_errors"]}', 'error'))
+
+    if log_entry['success']:
+        messages.append((f'{router["name"]}: {log_entry["message"]}', 'success'))
+    else:
+        messages.append((f'{router["name"]}: {log_entry["message"]}', 'error'))
+
+    return messages
+
+
+def _run_backup_all(routers, folder_id, delete_local, gdrive_authorized):
+    """
+    Back up all routers concurrently. Runs as a background task.
+
+    Returns:
+        list of (message, category) tuples to show the user
+    """
+    log_entries, fail_count = backup_routers(routers, folder_id, delete_local, gdrive_authorized, 'manual_all')
+    success_count = sum(1 for log_entry in log_entries if log_entry['success'])
+    fail_count += len(log_entries) - success_count
+
+    return [(f'Backup completed: {success_count} successful, {fail_count} failed',
+             'success' if fail_count == 0 else 'warning')]
 
 
 # Routes
@@ -90,16 +186,8 @@ def logout():
 @app.route('/')
 @login_required
 def dashboard():
-    routers = load_routers()
-    backup_log = load_backup_log()
     settings = load_settings()
-
-    # Get last backup for each router
-    last_backups = {}
-    for log in backup_log:
-        router_id = log.get('router_id')
-        if router_id:
-            last_backups[router_id] = log  # Later entries overwrite earlier ones
+    task_id = request.args.get('task')
 
     # Get next scheduled run time
     next_run = None
@@ -109,8 +197,19 @@ def dashboard():
         if job and job.next_run_time:
             next_run = job.next_run_time.isoformat()
 
-    return render_template('dashboard.html', routers=routers, last_backups=last_backups,
-                          next_run=next_run, schedule_enabled=schedule_enabled)
+    def render():
+        routers = load_routers()
+
+        # Get last backup for each router
+        last_backups = get_last_backups()
+
+        return render_template('dashboard.html', routers=routers, last_backups=last_backups,
+                               next_run=next_run, schedule_enabled=schedule_enabled,
+                               task_id=task_id)
+
+    etag = _page_etag([config.ROUTERS_FILE, config.LAST_BACKUPS_FILE],
+                      schedule_enabled, next_run, task_id)
+    return _conditional_page(etag, render)
 
 
 @app.route('/router/add', methods=['GET', 'POST'])
@@ -156,14 +255,16 @@ def bulk_upload():
             return redirect(url_for('bulk_upload'))
 
         try:
-            # Parse JSON content
-            content = file.read().decode('utf-8')
-            new_routers = json.loads(content)
+            # Stream-parse the upload rather than reading it into memory
+            events = ijson.parse(file.stream, use_float=True)
+            first_event = next(events)
 
-            if not isinstance(new_routers, list):
+            if first_event[1] != 'start_array':
                 flash('JSON must be an array of routers', 'error')
                 return redirect(url_for('bulk_upload'))
 
+            new_routers = ijson.items(chain([first_event], events), 'item')
+
             # Validate and add routers
             routers = load_routers()
             existing_ips = {r['ip'] for r in routers}
@@ -172,7 +273,7 @@ def bulk_upload():
 
             for router_data in new_routers:
                 # Validate required fields
-                if not all(key in router_data for key in ['name', 'ip', 'username', 'password']):
+                if not isinstance(router_data, dict) or not REQUIRED_ROUTER_FIELDS <= router_data.keys():
                     skipped += 1
                     continue
 
@@ -203,7 +304,7 @@ def bulk_upload():
 
             return redirect(url_for('dashboard'))
 
-        except json.JSONDecodeError:
+        except ijson.JSONError:
             flash('Invalid JSON file', 'error')
             return redirect(url_for('bulk_upload'))
         except Exception as e:
@@ -216,20 +317,14 @@ def bulk_upload():
 @app.route('/router/<router_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_router(router_id):
-    routers = load_routers()
-    router = None
-    router_index = None
+    routers, router_index = find_router(router_id)
 
-    for i, r in enumerate(routers):
-        if r['id'] == router_id:
-            router = r
-            router_index = i
-            break
-
-    if router is None:
+    if router_index is None:
         flash('Router not found', 'error')
         return redirect(url_for('dashboard'))
 
+    router = routers[router_index]
+
     if request.method == 'POST':
         router['name'] = request.form.get('name')
         router['ip'] = request.form.get('ip')
@@ -250,17 +345,12 @@ def edit_router(router_id):
 @app.route('/router/<router_id>/delete', methods=['POST'])
 @login_required
 def delete_router(router_id):
-    routers = load_routers()
-    router_name = None
+    routers, router_index = find_router(router_id)
 
-    for i, r in enumerate(routers):
-        if r['id'] == router_id:
-            router_name = r['name']
-            routers.pop(i)
-            break
-
-    if router_name:
+    if router_index is not None:
+        router_name = routers.pop(router_index)['name']
         save_routers(routers)
+        forget_last_backup(router_id)
         flash(f'Router "{router_name}" deleted', 'success')
     else:
         flash('Router not found', 'error')
@@ -271,7 +361,7 @@ def delete_router(router_id):
 @app.route('/router/<router_id>/test', methods=['POST'])
 @login_required
 def test_router(router_id):
-    router = get_router_by_id(router_id)
+    router = get_router(router_id)
 
     if router is None:
         flash('Router not found', 'error')
@@ -290,65 +380,14 @@ def test_router(router_id):
 @app.route('/backup/<router_id>', methods=['POST'])
 @login_required
 def backup_single(router_id):
-    router = get_router_by_id(router_id)
+    router, _, folder_id, delete_local, gdrive_authorized = build_backup_context(router_id)
 
     if router is None:
         flash('Router not found', 'error')
         return redirect(url_for('dashboard'))
 
-    result = create_backup(router)
-    log_entry = result.to_dict()
-    log_entry['triggered_by'] = 'manual'
-
-    # Upload to Google Drive if authorized
-    settings = load_settings()
-    folder_id = settings.get('google_drive_folder_id', '') or None  # Convert empty string to None
-
-    if result.success and result.local_files and gdrive_client.is_authorized():
-        drive_files = []
-        drive_errors = []
-        for local_file in result.local_files:
-            success, drive_result = gdrive_client.upload_file(local_file, folder_id)
-            if success:
-                drive_files.append({
-                    'id': drive_result.get('id'),
-                    'name': drive_result.get('name'),
-                    'link': drive_result.get('link')
-                })
-                # Delete local if configured
-                if settings.get('delete_local_after_upload', False):
-                    if os.path.exists(local_file):
-                        os.remove(local_file)
-            else:
-                drive_errors.append(drive_result)
-
-        if drive_files:
-            log_entry['drive_files'] = drive_files
-            flash(f'{len(drive_files)} file(s) uploaded to Google Drive', 'success')
-
-            # Delete old backups from Drive after successful upload
-            # Extract router identity from filename (format: identity-timestamp.ext)
-            if result.local_files:
-                filename = os.path.basename(result.local_files[0])
-                # Remove timestamp and extension to get identity
-                router_identity = '-'.join(filename.split('-')[:-1])
-                if router_identity:
-                    gdrive_client.delete_old_backups(router_identity, folder_id, keep_latest=12)
-
-        if drive_errors:
-            log_entry['drive_errors'] = drive_errors
-            flash(f'Some uploads failed: {drive_errors}', 'error')
-        if drive_files and settings.get('delete_local_after_upload', False):
-            log_entry['local_deleted'] = True
-
-    add_log_entry(log_entry)
-
-    if result.success:
-        flash(f'{router["name"]}: {result.message}', 'success')
-    else:
-        flash(f'{router["name"]}: {result.message}', 'error')
-
-    return redirect(url_for('dashboard'))
+    task_id = tasks.submit(_run_backup_single, router, folder_id, delete_local, gdrive_authorized)
+    return redirect(url_for('dashboard', task=task_id))
 
 
 @app.route('/backup/all', methods=['POST'])
@@ -360,62 +399,23 @@ def backup_all():
         flash('No routers configured', 'error')
         return redirect(url_for('dashboard'))
 
-    settings = load_settings()
-    folder_id = settings.get('google_drive_folder_id', '') or None  # Convert empty string to None
-    delete_local = settings.get('delete_local_after_upload', False)
-    gdrive_authorized = gdrive_client.is_authorized()
+    folder_id, delete_local, gdrive_authorized = _backup_options(load_settings())
+    task_id = tasks.submit(_run_backup_all, routers, folder_id, delete_local, gdrive_authorized)
+    return redirect(url_for('dashboard', task=task_id))
 
-    success_count = 0
-    fail_count = 0
-
-    for router in routers:
-        result = create_backup(router)
-        log_entry = result.to_dict()
-        log_entry['triggered_by'] = 'manual_all'
-
-        if result.success:
-            success_count += 1
-
-            # Upload to Google Drive if authorized
-            if result.local_files and gdrive_authorized:
-                drive_files = []
-                drive_errors = []
-                for local_file in result.local_files:
-                    success, drive_result = gdrive_client.upload_file(local_file, folder_id)
-                    if success:
-                        drive_files.append({
-                            'id': drive_result.get('id'),
-                            'name': drive_result.get('name'),
-                            'link': drive_result.get('link')
-                        })
-                        if delete_local and os.path.exists(local_file):
-                            os.remove(local_file)
-                    else:
-                        drive_errors.append(drive_result)
-
-                if drive_files:
-                    log_entry['drive_files'] = drive_files
-
-                    # Delete old backups from Drive after successful upload
-                    if result.local_files:
-                        filename = os.path.basename(result.local_files[0])
-                        router_identity = '-'.join(filename.split('-')[:-1])
-                        if router_identity:
-                            gdrive_client.delete_old_backups(router_identity, folder_id, keep_latest=12)
-
-                if drive_errors:
-                    log_entry['drive_errors'] = drive_errors
-                if drive_files and delete_local:
-                    log_entry['local_deleted'] = True
-        else:
-            fail_count += 1
 
-        add_log_entry(log_entry)
+@app.route('/task/<task_id>')
+@login_required
+def task_status(task_id):
+    """Report a background task's status, flashing its messages once it has finished."""
+    task = tasks.get_task(task_id)
+    if task is None:
+        return jsonify({'status': 'unknown'}), 404
 
-    flash(f'Backup completed: {success_count} successful, {fail_count} failed',
-          'success' if fail_count == 0 else 'warning')
+    for message, category in tasks.pop_messages(task_id):
+        flash(message, category)
 
-    return redirect(url_for('dashboard'))
+    return jsonify({'status': task['status']})
 
 
 @app.route('/settings', methods=['GET', 'POST'])
@@ -490,15 +490,29 @@ def gdrive_revoke():
 @app.route('/backups')
 @login_required
 def backups():
-    logs = load_backup_log()
-    return render_template('backups.html', logs=logs)
+    # The log never holds more than BACKUP_LOG_MAX_ENTRIES, so larger values mean nothing
+    offset = min(max(request.args.get('offset', 0, type=int), 0), config.BACKUP_LOG_MAX_ENTRIES)
+    limit = min(max(request.args.get('limit', 100, type=int), 1), config.BACKUP_LOG_MAX_ENTRIES)
+
+    def render():
+        # History is shown newest first, so only keep the tail of the log that covers this page
+        total = 0
+        window = deque(maxlen=offset + limit)
+        for log in load_backup_log():
+            window.append(log)
+            total += 1
+        logs = list(islice(window, max(len(window) - offset, 0)))
+
+        return render_template('backups.html', logs=logs, offset=offset, limit=limit, total=total)
+
+    return _conditional_page(_page_etag([config.BACKUP_LOG_FILE], offset, limit), render)
 
 
 @app.route('/download/<router_id>')
 @login_required
 def download_backup(router_id):
     """Download the last backup for a specific router from Google Drive."""
-    router = get_router_by_id(router_id)
+    router = get_router(router_id)
     if router is None:
         flash('Router not found', 'error')
         return redirect(url_for('dashboard'))
@@ -508,9 +522,8 @@ def download_backup(router_id):
         return redirect(url_for('dashboard'))
 
     # Find the last backup for this router
-    backup_log = load_backup_log()
     last_backup = None
-    for log in backup_log:
+    for log in load_backup_log():
         if log.get('router_id') == router_id and log.get('success') and log.get('drive_files'):
             last_backup = log
 
@@ -547,12 +560,9 @@ def download_all_backups():
         flash('Google Drive not authorized', 'error')
         return redirect(url_for('dashboard'))
 
-    routers = load_routers()
-    backup_log = load_backup_log()
-
     # Get last successful backup with drive files for each router
     last_backups = {}
-    for log in backup_log:
+    for log in load_backup_log():
         router_id = log.get('router_id')
         if router_id and log.get('success') and log.get('drive_files'):
             last_backups[router_id] = log
@@ -600,14 +610,14 @@ def download_all_backups():
     )
 
 
+# Compile the most frequently rendered templates up front
+for template_name in ('dashboard.html', 'backups.html'):
+    app.jinja_env.get_template(template_name)
+
 # Initialize scheduler on startup
 with app.app_context():
     init_scheduler(app)
 
 
 if __name__ == '__main__':
-    # Ensure directories exist
-    os.makedirs(config.DATA_DIR, exist_ok=True)
-    os.makedirs(config.BACKUP_DIR, exist_ok=True)
-
     app.run(host='0.0.0.0', port=config.PORT, debug=config.DEBUG)
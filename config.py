@@ -12,6 +12,9 @@ SECRET_KEY = os.environ.get('SECRET_KEY', 'change-this-secret-key-in-production'
 DEBUG = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
 PORT = int(os.environ.get('PORT', 5000))
 
+# Write data files indented for reading/debugging (compact by default)
+PRETTY_JSON = os.environ.get('PRETTY_JSON', 'False').lower() == 'true'
+
 # Admin credentials
 ADMIN_USERNAME = os.environ.get('ADMIN_USERNAME', 'admin')
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin123')
@@ -20,11 +23,21 @@ ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin123')
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 ROUTERS_FILE = os.path.join(DATA_DIR, 'routers.json')
 SETTINGS_FILE = os.path.join(DATA_DIR, 'settings.json')
-BACKUP_LOG_FILE = os.path.join(DATA_DIR, 'backup_log.json')
+BACKUP_LOG_FILE = os.path.join(DATA_DIR, 'backup_log.jsonl')  # One JSON entry per line
+LEGACY_BACKUP_LOG_FILE = os.path.join(DATA_DIR, 'backup_log.json')  # Old JSON array format
+LAST_BACKUPS_FILE = os.path.join(DATA_DIR, 'last_backups.json')  # Latest log entry per router
+UPLOAD_HASHES_FILE = os.path.join(DATA_DIR, 'upload_hashes.json')  # Digest of the last upload per router and file type
+
+# Backup log retention: entries kept, and the file size that triggers trimming it back down
+BACKUP_LOG_MAX_ENTRIES = 100
+BACKUP_LOG_COMPACT_SIZE = 1024 * 1024
 
 # Backup directory
 BACKUP_DIR = os.path.join(BASE_DIR, 'backups')
 
+# Maximum number of routers backed up at the same time
+BACKUP_MAX_WORKERS = int(os.environ.get('BACKUP_MAX_WORKERS', 16))
+
 # Google Drive OAuth2 credentials (can be set via environment variables)
 # GOOGLE_CLIENT_SECRET - JSON string of client_secret.json
 # GOOGLE_TOKEN - JSON string of token.json (after authorization)
@@ -43,3 +56,7 @@ DEFAULT_SETTINGS = {
 # MikroTik defaults
 DEFAULT_API_PORT = 8728
 DEFAULT_FTP_PORT = 21
+
+# How long to wait for the router to write backup files, and how often to check (seconds)
+BACKUP_FILE_TIMEOUT = 15
+BACKUP_FILE_POLL_INTERVAL = 0.25
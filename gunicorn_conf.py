@@ -0,0 +1,17 @@
+"""
+Gunicorn configuration
+Usage: gunicorn -c gunicorn_conf.py app:app
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# The backup scheduler and data caches live inside the process, so run a single
+# worker and get request concurrency from threads (backups are I/O bound)
+workers = 1
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Backups can keep a request busy for minutes
+timeout = 300
+keepalive = 5
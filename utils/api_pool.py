@@ -0,0 +1,128 @@
+"""
+RouterOS API Connection Pool
+Keeps logged-in API connections open between backups so each run
+doesn't have to repeat the login handshake.
+"""
+from routeros_api import RouterOsApiPool
+import atexit
+import threading
+import time
+import config
+
+# Connections idle for longer than this are closed (seconds)
+POOL_TTL = 600
+
+# How long a quick check waits for a pooled connection another thread is using (seconds)
+BUSY_TIMEOUT = 2
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+class PooledConnection:
+    def __init__(self, key, router):
+        self.key = key
+        self.pool = RouterOsApiPool(
+            router['ip'],
+            username=router['username'],
+            password=router['password'],
+            port=router.get('api_port', config.DEFAULT_API_PORT),
+            plaintext_login=True
+        )
+        self.api = None
+        self.broken = False  # Set by the caller to drop the connection on release
+        self.pooled = True  # False for a one-off connection made while the pooled one was busy
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+    def disconnect(self):
+        try:
+            self.pool.disconnect()
+        except Exception:
+            pass
+
+
+def _connection_key(router):
+    # Editing a router's address or credentials gives it a fresh connection
+    return (
+        router.get('id'),
+        router['ip'],
+        router.get('api_port', config.DEFAULT_API_PORT),
+        router['username'],
+        router['password']
+    )
+
+
+def _evict(conn):
+    """Drop a connection from the pool and close it. The caller must hold conn.lock."""
+    if not conn.pooled:
+        conn.disconnect()
+        return
+    with _connections_lock:
+        if _connections.get(conn.key) is conn:
+            del _connections[conn.key]
+    conn.disconnect()
+
+
+def acquire(router, ttl=POOL_TTL, timeout=None):
+    """
+    Get a logged-in API connection for a router, reusing a pooled one if possible.
+
+    The connection is held exclusively until release() is called. With a timeout,
+    a pooled connection still in use after that many seconds (e.g. by a running
+    backup) is not waited for; a one-off connection is opened instead.
+
+    Returns:
+        PooledConnection with a ready-to-use .api
+    """
+    key = _connection_key(router)
+    now = time.monotonic()
+
+    with _connections_lock:
+        # Close connections nobody has used for a while
+        for stale_key, stale in list(_connections.items()):
+            if now - stale.last_used > ttl and not stale.lock.locked():
+                del _connections[stale_key]
+                stale.disconnect()
+
+        conn = _connections.get(key)
+        if conn is None:
+            conn = _connections[key] = PooledConnection(key, router)
+
+    if not conn.lock.acquire(timeout=-1 if timeout is None else timeout):
+        conn = PooledConnection(key, router)
+        conn.pooled = False
+        conn.lock.acquire()
+
+    try:
+        if conn.pool.connected:
+            # The router may have dropped an idle session; check before reusing it
+            try:
+                conn.api.get_resource('/system/identity').get()
+            except Exception:
+                conn.disconnect()
+        conn.api = conn.pool.get_api()
+        conn.broken = False
+        return conn
+    except Exception:
+        _evict(conn)
+        conn.lock.release()
+        raise
+
+
+def release(conn):
+    """Return a connection to the pool, closing it if it was marked broken or not pooled."""
+    if conn.broken or not conn.pooled:
+        _evict(conn)
+    conn.last_used = time.monotonic()
+    conn.lock.release()
+
+
+@atexit.register
+def disconnect_all():
+    """Close every pooled connection."""
+    with _connections_lock:
+        connections = list(_connections.values())
+        _connections.clear()
+    for conn in connections:
+        conn.disconnect()
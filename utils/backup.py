@@ -2,21 +2,30 @@
 MikroTik Backup Utility
 Adapted from original script.py
 """
-from routeros_api import RouterOsApiPool
 from ftplib import FTP
 from datetime import datetime
 import time
 import os
 import config
+from utils import api_pool
+
+# API read chunk size, FTP transfer block size and local write buffer size (bytes)
+API_CHUNK_SIZE = 32 * 1024
+FTP_BLOCK_SIZE = 64 * 1024
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Create the backup directory once rather than on every backup
+os.makedirs(config.BACKUP_DIR, exist_ok=True)
 
 
 class BackupResult:
-    def __init__(self, success, router_id, router_name, message, local_files=None):
+    def __init__(self, success, router_id, router_name, message, local_files=None, identity=None):
         self.success = success
         self.router_id = router_id
         self.router_name = router_name
         self.message = message
         self.local_files = local_files or []  # List of file paths
+        self.identity = identity  # Router identity used as the backup filename prefix
         self.timestamp = datetime.now().isoformat()
 
     def to_dict(self):
@@ -30,6 +39,47 @@ class BackupResult:
         }
 
 
+def _wait_for_files(api, names):
+    """
+    Poll the router's file list until all of the given file names exist.
+
+    Returns:
+        bool: True if the files appeared, False on timeout
+    """
+    files = api.get_resource('/file')
+    deadline = time.monotonic() + config.BACKUP_FILE_TIMEOUT
+    while True:
+        present = {entry.get('name') for entry in files.get()}
+        if names <= present:
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(config.BACKUP_FILE_POLL_INTERVAL)
+
+
+def _read_file_via_api(api, name, local_path):
+    """
+    Download a file from the router over the existing API session using /file/read.
+
+    Requires RouterOS 7.13 or newer; raises on routers without /file/read.
+    """
+    files = api.get_binary_resource('/file')
+    offset = 0
+    with open(local_path, "wb", buffering=WRITE_BUFFER_SIZE) as f:
+        while True:
+            response = files.call('read', {
+                'file': name.encode(),
+                'offset': str(offset).encode(),
+                'chunk-size': str(API_CHUNK_SIZE).encode()
+            })
+            row = response[0] if response else response.done_message
+            chunk = row.get('data') or b''
+            f.write(chunk)
+            offset += len(chunk)
+            if len(chunk) < API_CHUNK_SIZE:
+                return
+
+
 def create_backup(router):
     """
     Create a backup for a single router.
@@ -47,22 +97,15 @@ def create_backup(router):
     username = router['username']
     password = router['password']
     ftp_port = router.get('ftp_port', config.DEFAULT_FTP_PORT)
-    api_port = router.get('api_port', config.DEFAULT_API_PORT)
 
-    api_pool = None
+    connection = None
     ftp = None
     local_files = []
 
     try:
-        # Connect to MikroTik API
-        api_pool = RouterOsApiPool(
-            router_ip,
-            username=username,
-            password=password,
-            port=api_port,
-            plaintext_login=True
-        )
-        api = api_pool.get_api()
+        # Connect to MikroTik API (reuses a pooled, logged-in connection)
+        connection = api_pool.acquire(router)
+        api = connection.api
 
         # Get router identity
         try:
@@ -74,9 +117,6 @@ def create_backup(router):
         timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
         filename = f"{identity}-{timestamp}"
 
-        # Ensure backup directory exists
-        os.makedirs(config.BACKUP_DIR, exist_ok=True)
-
         # 1. Create .rsc export file (text-based config)
         # Try with show-sensitive first, fall back without it for older RouterOS
         try:
@@ -108,33 +148,38 @@ def create_backup(router):
         )
 
         # Wait for router to write files
-        time.sleep(5)
+        if not _wait_for_files(api, {f"{filename}.rsc", f"{filename}.backup"}):
+            print(f"Warning: Timed out waiting for backup files on {router_name}, downloading anyway")
 
-        # Download via FTP
-        ftp = FTP()
-        ftp.connect(router_ip, ftp_port, timeout=30)
-        ftp.login(username, password)
+        # Each router downloads into its own directory: routers run concurrently and
+        # several can share an identity, so the filenames alone can collide
+        local_dir = os.path.join(config.BACKUP_DIR, router_id) if router_id else config.BACKUP_DIR
+        os.makedirs(local_dir, exist_ok=True)
 
-        # Download .rsc file
-        local_rsc = os.path.join(config.BACKUP_DIR, f"{filename}.rsc")
-        try:
-            with open(local_rsc, "wb") as f:
-                ftp.retrbinary(f"RETR {filename}.rsc", f.write)
-            local_files.append(local_rsc)
-        except Exception as e:
-            print(f"Warning: Could not download .rsc file: {e}")
+        # Download over the API session, falling back to FTP on older RouterOS
+        for name in (f"{filename}.rsc", f"{filename}.backup"):
+            local_path = os.path.join(local_dir, name)
+            try:
+                _read_file_via_api(api, name, local_path)
+                local_files.append(local_path)
+                continue
+            except Exception:
+                pass
 
-        # Download .backup file
-        local_backup = os.path.join(config.BACKUP_DIR, f"{filename}.backup")
-        try:
-            with open(local_backup, "wb") as f:
-                ftp.retrbinary(f"RETR {filename}.backup", f.write)
-            local_files.append(local_backup)
-        except Exception as e:
-            print(f"Warning: Could not download .backup file: {e}")
+            try:
+                if ftp is None:
+                    ftp = FTP()
+                    ftp.connect(router_ip, ftp_port, timeout=30)
+                    ftp.login(username, password)
+                with open(local_path, "wb", buffering=WRITE_BUFFER_SIZE) as f:
+                    ftp.retrbinary(f"RETR {name}", f.write, blocksize=FTP_BLOCK_SIZE)
+                local_files.append(local_path)
+            except Exception as e:
+                print(f"Warning: Could not download {name}: {e}")
 
-        ftp.quit()
-        ftp = None
+        if ftp:
+            ftp.quit()
+            ftp = None
 
         # Delete files from router
         try:
@@ -160,10 +205,13 @@ def create_backup(router):
             router_id=router_id,
             router_name=router_name,
             message=f"Backup created: {', '.join(file_names)}",
-            local_files=local_files
+            local_files=local_files,
+            identity=identity
         )
 
     except Exception as e:
+        if connection:
+            connection.broken = True
         return BackupResult(
             success=False,
             router_id=router_id,
@@ -177,11 +225,8 @@ def create_backup(router):
                 ftp.quit()
             except Exception:
                 pass
-        if api_pool:
-            try:
-                api_pool.disconnect()
-            except Exception:
-                pass
+        if connection:
+            api_pool.release(connection)
 
 
 def test_connection(router):
@@ -191,34 +236,22 @@ def test_connection(router):
     Returns:
         tuple: (success: bool, message: str)
     """
-    router_ip = router['ip']
-    username = router['username']
-    password = router['password']
-    api_port = router.get('api_port', config.DEFAULT_API_PORT)
-
-    api_pool = None
+    connection = None
 
     try:
-        api_pool = RouterOsApiPool(
-            router_ip,
-            username=username,
-            password=password,
-            port=api_port,
-            plaintext_login=True
-        )
-        api = api_pool.get_api()
+        # Don't wait out a backup that is using the pooled connection
+        connection = api_pool.acquire(router, timeout=api_pool.BUSY_TIMEOUT)
 
         # Try to get identity as a test
-        identity = api.get_resource('/system/identity').get()[0]['name']
+        identity = connection.api.get_resource('/system/identity').get()[0]['name']
 
         return True, f"Connected successfully to '{identity}'"
 
     except Exception as e:
+        if connection:
+            connection.broken = True
         return False, f"Connection failed: {str(e)}"
 
     finally:
-        if api_pool:
-            try:
-                api_pool.disconnect()
-            except Exception:
-                pass
+        if connection:
+            api_pool.release(connection)
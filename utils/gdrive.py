@@ -7,79 +7,217 @@ Supports both file-based and environment variable credentials:
 - GOOGLE_TOKEN: JSON string of token.json contents (for persistent auth)
 """
 import os
-import json
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import Flow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+import orjson
+import re
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 import io
 import config
 
+# The Google client libraries are slow to import, so they are imported inside the
+# methods that use them; start-up doesn't pay for them when Drive is unused.
+
 # OAuth2 scopes
 SCOPES = ['https://www.googleapis.com/auth/drive.file']
 
+# Socket timeout (seconds) for Drive API requests
+HTTP_TIMEOUT = 60
+
+# How long an is_authorized() check of the stored token is reused (seconds)
+AUTH_CHECK_TTL = 60
+
+# Maximum sub-requests the Drive batch endpoint accepts in one call
+BATCH_LIMIT = 100
+
+# Files larger than this use a resumable upload; smaller ones go in a single request (bytes)
+RESUMABLE_THRESHOLD = 5 * 1024 * 1024
+
+# Concurrent uploads per upload_files() call
+UPLOAD_WORKERS = 4
+
+# Drive v3 discovery document bundled with googleapiclient, read on first use
+_discovery_doc = None
+
 # Paths
 CREDENTIALS_DIR = os.path.join(config.BASE_DIR, 'credentials')
 CLIENT_SECRET_FILE = os.path.join(CREDENTIALS_DIR, 'client_secret.json')
 TOKEN_FILE = os.path.join(CREDENTIALS_DIR, 'token.json')
 
 
-def get_client_secret():
-    """Get client secret from file or environment variable."""
-    # Try environment variable first
-    env_secret = os.environ.get('GOOGLE_CLIENT_SECRET')
-    if env_secret:
-        try:
-            return json.loads(env_secret)
-        except json.JSONDecodeError:
-            pass
+# Parsed credentials JSON keyed by env var name or file path: {key: (source, data)}, where
+# source is the env var's value or the file's mtime, so a change to either is picked up
+_json_cache = {}
+_json_cache_lock = threading.Lock()
 
-    # Fall back to file
-    if os.path.exists(CLIENT_SECRET_FILE):
-        with open(CLIENT_SECRET_FILE, 'r') as f:
-            return json.load(f)
 
-    return None
+def _cached_parse(key, source, parse):
+    """Return parse() for the given source, reusing the last result while the source is unchanged."""
+    with _json_cache_lock:
+        cached = _json_cache.get(key)
+        if cached is not None and cached[0] == source:
+            return cached[1]
 
+    data = parse()
+    with _json_cache_lock:
+        _json_cache[key] = (source, data)
+    return data
 
-def get_token():
-    """Get token from file or environment variable."""
+
+def _parse_env(value):
+    try:
+        return orjson.loads(value)
+    except orjson.JSONDecodeError:
+        return None
+
+
+def _parse_file(path):
+    try:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def _load_json(env_name, path):
+    """
+    Load JSON from an environment variable, falling back to a file.
+
+    Results are cached until the variable or the file changes, so don't modify them.
+    """
     # Try environment variable first
-    env_token = os.environ.get('GOOGLE_TOKEN')
-    if env_token:
-        try:
-            return json.loads(env_token)
-        except json.JSONDecodeError:
-            pass
+    env_value = os.environ.get(env_name)
+    if env_value:
+        data = _cached_parse(env_name, env_value, lambda: _parse_env(env_value))
+        if data is not None:
+            return data
 
     # Fall back to file
-    if os.path.exists(TOKEN_FILE):
-        with open(TOKEN_FILE, 'r') as f:
-            return json.load(f)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    return _cached_parse(path, mtime, lambda: _parse_file(path))
 
-    return None
+
+def get_client_secret():
+    """Get client secret from file or environment variable."""
+    return _load_json('GOOGLE_CLIENT_SECRET', CLIENT_SECRET_FILE)
+
+
+def get_token():
+    """Get token from file or environment variable."""
+    return _load_json('GOOGLE_TOKEN', TOKEN_FILE)
+
+
+def _drive_discovery_doc():
+    """
+    Return a freshly parsed Drive v3 discovery document.
+
+    The file is read once, but it is parsed for every service built because
+    googleapiclient adds to the document while using it.
+    """
+    global _discovery_doc
+    if _discovery_doc is None:
+        from googleapiclient.discovery_cache import get_static_doc
+        _discovery_doc = get_static_doc('drive', 'v3')
+    return orjson.loads(_discovery_doc)
+
+
+def _token_data(creds):
+    """Token dict for credentials, as Credentials.to_json() would produce but without the JSON round-trip."""
+    token_data = {
+        'token': creds.token,
+        'refresh_token': creds.refresh_token,
+        'token_uri': creds.token_uri,
+        'client_id': creds.client_id,
+        'client_secret': creds.client_secret,
+        'scopes': creds.scopes,
+        'rapt_token': creds.rapt_token,
+        'universe_domain': getattr(creds, 'universe_domain', None),
+        'expiry': creds.expiry.isoformat() + 'Z' if creds.expiry else None
+    }
+    return {key: value for key, value in token_data.items() if value is not None}
 
 
 def save_token(token_data):
     """Save token to file and print for env var setup."""
     os.makedirs(CREDENTIALS_DIR, exist_ok=True)
 
-    # Save to file
-    with open(TOKEN_FILE, 'w') as f:
-        json.dump(token_data, f)
+    content = orjson.dumps(token_data)
+
+    # Save to file, replacing it atomically so a crash can't leave a truncated token
+    tmp_path = TOKEN_FILE + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, TOKEN_FILE)
 
     # Print for environment variable setup (useful for deployment)
     print("\n[Google Drive] Token saved. For deployment, set this environment variable:")
-    print(f"GOOGLE_TOKEN={json.dumps(token_data)}\n")
+    print(f"GOOGLE_TOKEN={content.decode()}\n")
+
+
+def _backups_query(router_identity, folder_id):
+    """Drive search query for a router's backup files."""
+    # Search for files starting with router identity
+    query = f"name contains '{router_identity}-' and trashed = false"
+    if folder_id:
+        query += f" and '{folder_id}' in parents"
+    return query
+
+
+def _backup_name_pattern(router_identity):
+    """Full backup filename for a router: '<identity>-YYYYMMDD-HHMMSS.rsc' or '.backup'."""
+    return re.compile(re.escape(router_identity) + r'-\d{8}-\d{6}\.(rsc|backup)')
 
 
 class GoogleDriveClient:
     def __init__(self):
-        self.service = None
-        self._initialized = False
+        # The Drive service wraps an httplib2 transport, which is not thread-safe, so
+        # each call checks one out of a pool of idle services. They outlive the worker
+        # threads that use them, keeping their connections warm across backup runs.
+        self._creds = None
+        self._authorized = (None, False)  # (monotonic time checked, result) for is_authorized()
+        self._idle_services = []
+        self._pool_lock = threading.Lock()
+        self._generation = 0
+        self._init_lock = threading.Lock()
         self._error = None
 
+    def _reset(self):
+        """Drop the credentials and every pooled service so they are rebuilt on next use."""
+        with self._pool_lock:
+            self._creds = None
+            self._authorized = (None, False)
+            self._idle_services = []
+            self._generation += 1
+
+    @contextmanager
+    def _service(self):
+        """Check out a Drive service for the duration of a call. initialize() must have succeeded."""
+        from google_auth_httplib2 import AuthorizedHttp
+        from googleapiclient.discovery import build_from_document
+        import httplib2
+
+        with self._pool_lock:
+            generation = self._generation
+            service = self._idle_services.pop() if self._idle_services else None
+            creds = self._creds
+
+        if service is None:
+            http = AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+            service = build_from_document(_drive_discovery_doc(), http=http)
+
+        try:
+            yield service
+        finally:
+            with self._pool_lock:
+                # Services built from revoked or replaced credentials are discarded
+                if generation == self._generation:
+                    self._idle_services.append(service)
+
     def get_auth_url(self, redirect_uri):
         """
         Get the OAuth2 authorization URL.
@@ -87,6 +225,8 @@ class GoogleDriveClient:
         Returns:
             tuple: (success, auth_url or error_message)
         """
+        from google_auth_oauthlib.flow import Flow
+
         client_config = get_client_secret()
         if not client_config:
             return False, "Client secret not found. Set GOOGLE_CLIENT_SECRET env var or add client_secret.json file."
@@ -117,6 +257,8 @@ class GoogleDriveClient:
         Returns:
             tuple: (success, message)
         """
+        from google_auth_oauthlib.flow import Flow
+
         client_config = get_client_secret()
         if not client_config:
             return False, "Client secret not found"
@@ -129,59 +271,81 @@ class GoogleDriveClient:
             )
             flow.fetch_token(authorization_response=authorization_response)
 
-            credentials = flow.credentials
-            token_data = json.loads(credentials.to_json())
-
             # Save the token
-            save_token(token_data)
+            save_token(_token_data(flow.credentials))
 
-            self._initialized = False  # Reset to force re-init with new token
+            self._reset()  # Force re-init with new token
             return True, "Google Drive authorized successfully!"
         except Exception as e:
             return False, f"Authorization failed: {str(e)}"
 
     def is_authorized(self):
         """Check if we have valid credentials."""
+        creds = self._creds
+        if creds and (creds.valid or creds.refresh_token):
+            return True
+
+        # Without loaded credentials, re-check the stored token at most every AUTH_CHECK_TTL seconds
+        checked_at, authorized = self._authorized
+        if checked_at is not None and time.monotonic() - checked_at < AUTH_CHECK_TTL:
+            return authorized
+
+        from google.oauth2.credentials import Credentials
+
+        authorized = False
         token_data = get_token()
         if token_data:
             try:
                 creds = Credentials.from_authorized_user_info(token_data, SCOPES)
-                return creds and creds.valid or (creds and creds.expired and creds.refresh_token)
+                authorized = bool(creds and creds.valid or (creds and creds.expired and creds.refresh_token))
             except Exception:
-                return False
-        return False
+                pass
+
+        self._authorized = (time.monotonic(), authorized)
+        return authorized
 
     def initialize(self):
-        """Initialize the Google Drive service."""
-        if self._initialized and self.service:
+        """Initialize the Google Drive credentials, reusing them while they are valid."""
+        creds = self._creds
+        if creds and creds.valid:
             return True, None
 
-        token_data = get_token()
-        if not token_data:
-            self._error = "Not authorized. Please authorize Google Drive access first."
-            return False, self._error
-
-        try:
-            creds = Credentials.from_authorized_user_info(token_data, SCOPES)
+        from google.oauth2.credentials import Credentials
+        from google.auth.transport.requests import Request
 
-            # Refresh token if expired
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-                # Save refreshed token
-                refreshed_data = json.loads(creds.to_json())
-                save_token(refreshed_data)
+        # Threads initialize concurrently; serialize so the token is refreshed and saved once
+        with self._init_lock:
+            creds = self._creds
+            if creds and creds.valid:
+                return True, None
 
-            if not creds or not creds.valid:
-                self._error = "Invalid credentials. Please re-authorize Google Drive access."
+            try:
+                # The token file is only read the first time; after that the cached
+                # credentials are refreshed in place
+                if creds is None:
+                    token_data = get_token()
+                    if not token_data:
+                        self._error = "Not authorized. Please authorize Google Drive access first."
+                        return False, self._error
+                    creds = Credentials.from_authorized_user_info(token_data, SCOPES)
+
+                # Refresh token if expired
+                if creds and creds.expired and creds.refresh_token:
+                    creds.refresh(Request())
+                    # Save refreshed token
+                    save_token(_token_data(creds))
+
+                if not creds or not creds.valid:
+                    self._error = "Invalid credentials. Please re-authorize Google Drive access."
+                    return False, self._error
+
+                with self._pool_lock:
+                    self._creds = creds
+                return True, None
+            except Exception as e:
+                self._error = f"Failed to initialize Google Drive: {str(e)}"
                 return False, self._error
 
-            self.service = build('drive', 'v3', credentials=creds)
-            self._initialized = True
-            return True, None
-        except Exception as e:
-            self._error = f"Failed to initialize Google Drive: {str(e)}"
-            return False, self._error
-
     def upload_file(self, local_path, folder_id=None):
         """
         Upload a file to Google Drive.
@@ -193,6 +357,8 @@ class GoogleDriveClient:
         Returns:
             tuple: (success: bool, file_id or error_message: str)
         """
+        from googleapiclient.http import MediaFileUpload
+
         success, error = self.initialize()
         if not success:
             return False, error
@@ -200,33 +366,88 @@ class GoogleDriveClient:
         if not os.path.exists(local_path):
             return False, f"File not found: {local_path}"
 
-        try:
-            filename = os.path.basename(local_path)
+        with self._service() as service:
+            try:
+                filename = os.path.basename(local_path)
+
+                file_metadata = {'name': filename}
+                if folder_id:
+                    file_metadata['parents'] = [folder_id]
+
+                # A resumable session costs an extra round-trip, only worth it for large files
+                media = MediaFileUpload(
+                    local_path,
+                    mimetype='application/octet-stream',
+                    resumable=os.path.getsize(local_path) > RESUMABLE_THRESHOLD
+                )
+
+                file = service.files().create(
+                    body=file_metadata,
+                    media_body=media,
+                    fields='id, name, webViewLink'
+                ).execute()
+
+                return True, {
+                    'id': file.get('id'),
+                    'name': file.get('name'),
+                    'link': file.get('webViewLink')
+                }
+
+            except Exception as e:
+                return False, f"Upload failed: {str(e)}"
+
+    def upload_files(self, local_paths, folder_id=None):
+        """
+        Upload several files to Google Drive concurrently.
 
-            file_metadata = {'name': filename}
-            if folder_id:
-                file_metadata['parents'] = [folder_id]
+        Media uploads can't be batched, so each file is its own request on its own thread.
 
-            media = MediaFileUpload(
-                local_path,
-                mimetype='text/plain',
-                resumable=True
+        Returns:
+            list of (success, file info or error_message) tuples, in the same order as local_paths
+        """
+        if not local_paths:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(UPLOAD_WORKERS, len(local_paths))) as executor:
+            return list(executor.map(lambda path: self.upload_file(path, folder_id), local_paths))
+
+    def _iter_files(self, query, fields, page_size=100):
+        """
+        Yield files matching a query, newest first, fetching each page only when it is reached.
+
+        initialize() must have succeeded. Drive errors are raised to the consumer.
+        """
+        with self._service() as service:
+            files = service.files()
+            request = files.list(
+                q=query,
+                pageSize=page_size,
+                fields=f"nextPageToken, files({fields})",
+                orderBy="createdTime desc"
             )
+            while request is not None:
+                response = request.execute()
+                yield from response.get('files', [])
+                request = files.list_next(request, response)
 
-            file = self.service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id, name, webViewLink'
-            ).execute()
+    def iter_files(self, folder_id=None, page_size=100):
+        """
+        Iterate over files in Google Drive, newest first, one page at a time.
 
-            return True, {
-                'id': file.get('id'),
-                'name': file.get('name'),
-                'link': file.get('webViewLink')
-            }
+        Use islice() or next() to read only as many files as needed.
 
-        except Exception as e:
-            return False, f"Upload failed: {str(e)}"
+        Raises:
+            RuntimeError: if Google Drive is not authorized
+        """
+        success, error = self.initialize()
+        if not success:
+            raise RuntimeError(error)
+
+        query = "mimeType != 'application/vnd.google-apps.folder'"
+        if folder_id:
+            query += f" and '{folder_id}' in parents"
+
+        yield from self._iter_files(query, "id, name, createdTime, size, webViewLink", page_size)
 
     def list_files(self, folder_id=None, max_results=50):
         """
@@ -239,25 +460,10 @@ class GoogleDriveClient:
         Returns:
             tuple: (success: bool, list of files or error_message)
         """
-        success, error = self.initialize()
-        if not success:
-            return False, error
-
         try:
-            query = "mimeType != 'application/vnd.google-apps.folder'"
-            if folder_id:
-                query += f" and '{folder_id}' in parents"
-
-            results = self.service.files().list(
-                q=query,
-                pageSize=max_results,
-                fields="files(id, name, createdTime, size, webViewLink)",
-                orderBy="createdTime desc"
-            ).execute()
-
-            files = results.get('files', [])
-            return True, files
-
+            return True, list(islice(self.iter_files(folder_id, page_size=max_results), max_results))
+        except RuntimeError as e:
+            return False, str(e)
         except Exception as e:
             return False, f"Failed to list files: {str(e)}"
 
@@ -275,11 +481,51 @@ class GoogleDriveClient:
         if not success:
             return False, error
 
-        try:
-            self.service.files().delete(fileId=file_id).execute()
-            return True, "File deleted successfully"
-        except Exception as e:
-            return False, f"Failed to delete file: {str(e)}"
+        with self._service() as service:
+            try:
+                service.files().delete(fileId=file_id).execute()
+                return True, "File deleted successfully"
+            except Exception as e:
+                return False, f"Failed to delete file: {str(e)}"
+
+    def delete_files(self, file_ids):
+        """
+        Delete several files from Google Drive using batch requests.
+
+        Args:
+            file_ids: Google Drive file IDs
+
+        Returns:
+            tuple: (success: bool, list of deleted file IDs or error_message)
+        """
+        if not file_ids:
+            return True, []
+
+        success, error = self.initialize()
+        if not success:
+            return False, error
+
+        deleted = []
+
+        def on_delete(request_id, response, exception):
+            if exception is None:
+                deleted.append(request_id)
+
+        # One HTTP round-trip per BATCH_LIMIT files instead of one per file
+        with self._service() as service:
+            try:
+                # Ids double as batch request ids, which must be unique; routers whose
+                # identities overlap find the same old files
+                file_ids = list(dict.fromkeys(file_ids))
+                for start in range(0, len(file_ids), BATCH_LIMIT):
+                    batch = service.new_batch_http_request(callback=on_delete)
+                    for file_id in file_ids[start:start + BATCH_LIMIT]:
+                        batch.add(service.files().delete(fileId=file_id), request_id=file_id)
+                    batch.execute()
+            except Exception as e:
+                return False, f"Failed to delete files: {str(e)}"
+
+        return True, deleted
 
     def download_file(self, file_id):
         """
@@ -291,32 +537,35 @@ class GoogleDriveClient:
         Returns:
             tuple: (success: bool, (file_content, filename) or error_message)
         """
+        from googleapiclient.http import MediaIoBaseDownload
+
         success, error = self.initialize()
         if not success:
             return False, error
 
-        try:
-            # Get file metadata for the filename
-            file_metadata = self.service.files().get(
-                fileId=file_id,
-                fields='name'
-            ).execute()
-            filename = file_metadata.get('name', 'backup')
+        with self._service() as service:
+            try:
+                # Get file metadata for the filename
+                file_metadata = service.files().get(
+                    fileId=file_id,
+                    fields='name'
+                ).execute()
+                filename = file_metadata.get('name', 'backup')
 
-            # Download file content
-            request = self.service.files().get_media(fileId=file_id)
-            file_content = io.BytesIO()
-            downloader = MediaIoBaseDownload(file_content, request)
+                # Download file content
+                request = service.files().get_media(fileId=file_id)
+                file_content = io.BytesIO()
+                downloader = MediaIoBaseDownload(file_content, request)
 
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
+                done = False
+                while not done:
+                    status, done = downloader.next_chunk()
 
-            file_content.seek(0)
-            return True, (file_content.read(), filename)
+                file_content.seek(0)
+                return True, (file_content.read(), filename)
 
-        except Exception as e:
-            return False, f"Download failed: {str(e)}"
+            except Exception as e:
+                return False, f"Download failed: {str(e)}"
 
     def get_file_info(self, file_id):
         """
@@ -332,14 +581,51 @@ class GoogleDriveClient:
         if not success:
             return False, error
 
-        try:
-            file_info = self.service.files().get(
-                fileId=file_id,
-                fields='id, name, size, createdTime, webViewLink'
-            ).execute()
-            return True, file_info
-        except Exception as e:
-            return False, f"Failed to get file info: {str(e)}"
+        with self._service() as service:
+            try:
+                file_info = service.files().get(
+                    fileId=file_id,
+                    fields='id, name, size, createdTime, webViewLink'
+                ).execute()
+                return True, file_info
+            except Exception as e:
+                return False, f"Failed to get file info: {str(e)}"
+
+    def file_exists(self, file_id):
+        """
+        Check that a file is still in Google Drive and not in the trash.
+
+        Returns:
+            tuple: (success: bool, exists: bool or error_message)
+        """
+        from googleapiclient.errors import HttpError
+
+        success, error = self.initialize()
+        if not success:
+            return False, error
+
+        with self._service() as service:
+            try:
+                file_info = service.files().get(fileId=file_id, fields='trashed').execute()
+                return True, not file_info.get('trashed', False)
+            except HttpError as e:
+                if e.resp.status == 404:
+                    return True, False
+                return False, f"Failed to get file info: {str(e)}"
+            except Exception as e:
+                return False, f"Failed to get file info: {str(e)}"
+
+    def _iter_router_backups(self, router_identity, folder_id, fields):
+        """
+        Yield a router's backup files, newest first.
+
+        Drive's 'contains' matches name prefixes, so the search also finds routers whose
+        identity starts with this one (e.g. 'core-2' for 'core'); those are filtered out.
+        """
+        pattern = _backup_name_pattern(router_identity)
+        for file in self._iter_files(_backups_query(router_identity, folder_id), fields):
+            if pattern.fullmatch(file.get('name', '')):
+                yield file
 
     def find_router_backups(self, router_identity, folder_id=None):
         """
@@ -357,21 +643,26 @@ class GoogleDriveClient:
             return False, error
 
         try:
-            # Search for files starting with router identity
-            query = f"name contains '{router_identity}-' and trashed = false"
-            if folder_id:
-                query += f" and '{folder_id}' in parents"
+            return True, list(self._iter_router_backups(router_identity, folder_id, "id, name, createdTime"))
+        except Exception as e:
+            return False, f"Failed to find backups: {str(e)}"
 
-            results = self.service.files().list(
-                q=query,
-                pageSize=100,
-                fields="files(id, name, createdTime)",
-                orderBy="createdTime desc"
-            ).execute()
+    def find_old_backups(self, router_identity, folder_id=None, keep_latest=0):
+        """
+        Find a router's backup files that fall outside the latest ones to keep.
 
-            files = results.get('files', [])
-            return True, files
+        Returns:
+            tuple: (success: bool, list of files or error_message)
+        """
+        success, error = self.initialize()
+        if not success:
+            return False, error
 
+        try:
+            # Files come newest first, so the ones to keep are simply skipped.
+            # Callers only delete them by id and log the name.
+            files = self._iter_router_backups(router_identity, folder_id, "id, name")
+            return True, list(islice(files, keep_latest, None))
         except Exception as e:
             return False, f"Failed to find backups: {str(e)}"
 
@@ -387,24 +678,22 @@ class GoogleDriveClient:
         Returns:
             tuple: (success: bool, count of deleted files or error_message)
         """
-        success, files = self.find_router_backups(router_identity, folder_id)
+        success, files = self.find_old_backups(router_identity, folder_id, keep_latest)
         if not success:
             return False, files  # files contains error message
 
         if not files:
             return True, 0
 
-        # Sort by created time descending (newest first)
-        files_to_delete = files[keep_latest:] if keep_latest > 0 else files
+        success, deleted = self.delete_files([file['id'] for file in files])
+        if not success:
+            return False, deleted  # deleted contains error message
 
-        deleted_count = 0
-        for file in files_to_delete:
-            success, _ = self.delete_file(file['id'])
-            if success:
-                deleted_count += 1
-                print(f"[Google Drive] Deleted old backup: {file['name']}")
+        names = {file['id']: file['name'] for file in files}
+        for file_id in deleted:
+            print(f"[Google Drive] Deleted old backup: {names[file_id]}")
 
-        return True, deleted_count
+        return True, len(deleted)
 
     def test_connection(self, folder_id=None):
         """
@@ -420,34 +709,36 @@ class GoogleDriveClient:
         if not success:
             return False, error
 
-        try:
-            # Try to get user info as a connection test
-            about = self.service.about().get(fields="user").execute()
-            user_email = about.get('user', {}).get('emailAddress', 'Unknown')
-
-            if folder_id:
-                # Verify folder access
-                try:
-                    folder = self.service.files().get(
-                        fileId=folder_id,
-                        fields="name"
-                    ).execute()
-                    folder_name = folder.get('name', 'Unknown')
-                    return True, f"Connected as {user_email}. Folder: {folder_name}"
-                except Exception:
-                    return False, f"Connected as {user_email}, but cannot access folder ID: {folder_id}. Make sure the folder exists and you have access."
-
-            return True, f"Connected as {user_email}"
-
-        except Exception as e:
-            return False, f"Connection test failed: {str(e)}"
+        with self._service() as service:
+            try:
+                # Try to get user info as a connection test
+                about = service.about().get(fields="user(emailAddress)").execute()
+                user_email = about.get('user', {}).get('emailAddress', 'Unknown')
+
+                if folder_id:
+                    # Verify folder access
+                    try:
+                        folder = service.files().get(
+                            fileId=folder_id,
+                            fields="name"
+                        ).execute()
+                        folder_name = folder.get('name', 'Unknown')
+                        return True, f"Connected as {user_email}. Folder: {folder_name}"
+                    except Exception:
+                        return False, f"Connected as {user_email}, but cannot access folder ID: {folder_id}. Make sure the folder exists and you have access."
+
+                return True, f"Connected as {user_email}"
+
+            except Exception as e:
+                return False, f"Connection test failed: {str(e)}"
 
     def revoke(self):
         """Revoke access and delete stored token."""
-        if os.path.exists(TOKEN_FILE):
+        try:
             os.remove(TOKEN_FILE)
-        self._initialized = False
-        self.service = None
+        except FileNotFoundError:
+            pass
+        self._reset()
 
 
 # Singleton instance
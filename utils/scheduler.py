@@ -2,61 +2,497 @@
 Backup Scheduler using APScheduler
 """
 from flask_apscheduler import APScheduler
-import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import deque
+import copy
+import hashlib
+import orjson
 import os
+import threading
 from datetime import datetime
 import config
 
 scheduler = APScheduler()
 
+# Create the data directory once so writers don't have to check on every save
+os.makedirs(config.DATA_DIR, exist_ok=True)
+
 JOB_ID = 'backup_all_routers'
 
+# Serializes access to the backup log across request and scheduler threads.
+# Re-entrant because rebuilding the last-backups index reads the log while holding it.
+_log_lock = threading.RLock()
+
+# Parsed backup log entries for the log file's stat: (mtime_ns, size, [entries])
+_log_cache = None
+
+# Latest log entry per router id, loaded on first use and kept current by add_log_entries
+_last_backups = None
+
+# JSON files keyed by path: {path: (mtime_ns, raw bytes, parsed data)}. The parsed
+# data is shared and read-only; callers get a fresh parse of the raw bytes instead,
+# which is much cheaper than deep-copying it.
+_json_cache = {}
+_json_cache_lock = threading.Lock()
+
+# Router id -> position in routers.json, for one routers cache entry: (cache entry, {id: index})
+_router_index = (None, {})
+
+# Settings file mtime the backup job was last scheduled from (0 when the file is missing)
+_scheduled_settings_mtime = None
+
+# Last uploaded file per router and extension, loaded on first use:
+# {router_id: {ext: {'sha256': hex digest, 'id', 'name', 'link': Drive file, 'folder_id': Drive folder id}}}
+_upload_hashes = None
+_upload_hashes_lock = threading.Lock()
+
+
+def _atomic_write(path, content):
+    """Write bytes to a file in one write, replacing it atomically so readers never see a partial file."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def _cache_entry(path):
+    """Return the cached (mtime_ns, raw, data) for a JSON file, re-reading it if it changed."""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    with _json_cache_lock:
+        cached = _json_cache.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path, 'rb') as f:
+                raw = f.read()
+            cached = (mtime, raw, orjson.loads(raw))
+            _json_cache[path] = cached
+        return cached
+
+
+def _cached_json(path, default):
+    """
+    Load a JSON file, re-reading it only when its modification time changes.
+
+    Returns a fresh object so callers can freely modify the result.
+    """
+    cached = _cache_entry(path)
+    if cached is None:
+        return copy.deepcopy(default)
+    return orjson.loads(cached[1])
+
+
+def _write_json(path, data):
+    """Atomically write a JSON file and refresh its cache entry."""
+    content = orjson.dumps(data, option=orjson.OPT_INDENT_2 if config.PRETTY_JSON else None)
+
+    with _json_cache_lock:
+        _atomic_write(path, content)
+        _json_cache[path] = (os.stat(path).st_mtime_ns, content, orjson.loads(content))
+
 
 def load_settings():
     """Load settings from JSON file."""
-    if os.path.exists(config.SETTINGS_FILE):
-        with open(config.SETTINGS_FILE, 'r') as f:
-            return json.load(f)
-    return config.DEFAULT_SETTINGS.copy()
+    return _cached_json(config.SETTINGS_FILE, config.DEFAULT_SETTINGS)
 
 
 def save_settings(settings):
     """Save settings to JSON file."""
-    os.makedirs(os.path.dirname(config.SETTINGS_FILE), exist_ok=True)
-    with open(config.SETTINGS_FILE, 'w') as f:
-        json.dump(settings, f, indent=2)
+    _write_json(config.SETTINGS_FILE, settings)
 
 
 def load_routers():
     """Load routers from JSON file."""
-    if os.path.exists(config.ROUTERS_FILE):
-        with open(config.ROUTERS_FILE, 'r') as f:
-            return json.load(f)
-    return []
+    return _cached_json(config.ROUTERS_FILE, [])
+
+
+def save_routers(routers):
+    """Save routers to JSON file."""
+    _write_json(config.ROUTERS_FILE, routers)
+
+
+def _indexed_routers():
+    """
+    Return one snapshot of routers.json as (raw bytes, shared parsed list, {id: index}).
+
+    The index always belongs to the same snapshot as the list.
+    """
+    global _router_index
+    cached = _cache_entry(config.ROUTERS_FILE)
+    if cached is None:
+        return None, [], {}
+
+    # Keyed on the cache entry itself: two saves can share an mtime on coarse-grained filesystems
+    _, raw, routers = cached
+    with _json_cache_lock:
+        if _router_index[0] is not cached:
+            _router_index = (cached, {r['id']: i for i, r in enumerate(routers)})
+        by_id = _router_index[1]
+    return raw, routers, by_id
+
+
+def find_router(router_id):
+    """
+    Load the routers list along with a router's position in it.
+
+    Returns:
+        tuple: (list of routers, index of the router or None)
+    """
+    raw, routers, by_id = _indexed_routers()
+    if raw is None:
+        return [], None
+
+    index = by_id.get(router_id)
+    if index is None or routers[index]['id'] != router_id:
+        return orjson.loads(raw), None
+    return orjson.loads(raw), index
+
+
+def get_router(router_id):
+    """Return a copy of the router with the given id, or None."""
+    _, routers, by_id = _indexed_routers()
+    index = by_id.get(router_id)
+    if index is None or routers[index]['id'] != router_id:
+        return None
+    return copy.deepcopy(routers[index])
+
+
+def _log_stat():
+    try:
+        st = os.stat(config.BACKUP_LOG_FILE)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _read_log_tail():
+    """
+    Parse the last BACKUP_LOG_MAX_ENTRIES lines of the log file.
+
+    Malformed lines, such as one torn by a crash mid-append, are skipped.
+
+    Returns:
+        list of (raw line, entry) tuples, oldest first
+    """
+    with open(config.BACKUP_LOG_FILE, 'rb') as f:
+        lines = deque((line for line in f if line.strip()), maxlen=config.BACKUP_LOG_MAX_ENTRIES)
+
+    parsed = []
+    for line in lines:
+        try:
+            parsed.append((line, orjson.loads(line)))
+        except orjson.JSONDecodeError:
+            print(f"[Scheduler] Skipping malformed backup log line: {line[:80]!r}")
+    return parsed
 
 
 def load_backup_log():
-    """Load backup log from JSON file."""
-    if os.path.exists(config.BACKUP_LOG_FILE):
-        with open(config.BACKUP_LOG_FILE, 'r') as f:
-            return json.load(f)
-    return []
+    """
+    Iterate over the latest backup log entries, oldest first.
+
+    Only the last BACKUP_LOG_MAX_ENTRIES lines are parsed. The result is cached
+    until the file changes. Entries are shared between callers, so don't modify them.
+    """
+    global _log_cache
+    with _log_lock:
+        stat = _log_stat()
+        if stat is None:
+            return iter(())
+
+        if _log_cache is None or _log_cache[:2] != stat:
+            _log_cache = (*stat, [entry for _, entry in _read_log_tail()])
+
+        # Snapshot the list so appends don't affect iteration in progress
+        return iter(tuple(_log_cache[2]))
 
 
 def save_backup_log(log):
-    """Save backup log to JSON file."""
-    os.makedirs(os.path.dirname(config.BACKUP_LOG_FILE), exist_ok=True)
-    # Keep only last 100 entries
-    log = log[-100:]
-    with open(config.BACKUP_LOG_FILE, 'w') as f:
-        json.dump(log, f, indent=2)
+    """Rewrite the backup log file from a list of entries."""
+    global _log_cache
+    log = log[-config.BACKUP_LOG_MAX_ENTRIES:]
+    content = b''.join(orjson.dumps(entry) + b'\n' for entry in log)
+    with _log_lock:
+        _atomic_write(config.BACKUP_LOG_FILE, content)
+        _log_cache = (*_log_stat(), list(log))
+
+
+def _compact_backup_log():
+    """Trim the log file to its last BACKUP_LOG_MAX_ENTRIES lines. Hold _log_lock."""
+    global _log_cache
+    cache_current = _log_cache is not None and _log_cache[:2] == _log_stat()
+
+    # Kept lines are copied as-is rather than re-serialized; malformed ones are dropped
+    _atomic_write(config.BACKUP_LOG_FILE, b''.join(line for line, _ in _read_log_tail()))
+
+    # The cache already holds exactly these entries, read from the same lines
+    _log_cache = (*_log_stat(), _log_cache[2]) if cache_current else None
 
 
 def add_log_entry(entry):
-    """Add an entry to the backup log."""
-    log = load_backup_log()
-    log.append(entry)
+    """Append an entry to the backup log."""
+    add_log_entries([entry])
+
+
+def add_log_entries(entries):
+    """Append entries to the backup log with a single write."""
+    global _log_cache
+    if not entries:
+        return
+
+    with _log_lock:
+        cache_current = _log_cache is not None and _log_cache[:2] == _log_stat()
+
+        content = b''.join(orjson.dumps(entry) + b'\n' for entry in entries)
+        with open(config.BACKUP_LOG_FILE, 'a+b') as f:
+            # Start on a fresh line if a crash left the last one unterminated,
+            # so the torn line can't swallow these entries
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    content = b'\n' + content
+            f.write(content)
+
+        # Extend the cached log in place rather than re-parsing the file next time
+        if cache_current:
+            cached = _log_cache[2]
+            cached.extend(entries)
+            del cached[:-config.BACKUP_LOG_MAX_ENTRIES]
+            _log_cache = (*_log_stat(), cached)
+        else:
+            _log_cache = None
+
+        # Appends never rewrite the file, so trim it once it grows past the threshold
+        if _log_stat()[1] > config.BACKUP_LOG_COMPACT_SIZE:
+            _compact_backup_log()
+
+        routed = [entry for entry in entries if entry.get('router_id')]
+        if routed:
+            last_backups = _get_last_backups()
+            for entry in routed:
+                last_backups[entry['router_id']] = entry
+            _save_last_backups()
+
+
+def _get_last_backups():
+    """Return the latest-entry-per-router dict, loading or rebuilding it on first use. Hold _log_lock."""
+    global _last_backups
+    if _last_backups is None:
+        try:
+            with open(config.LAST_BACKUPS_FILE, 'rb') as f:
+                _last_backups = orjson.loads(f.read())
+        except FileNotFoundError:
+            # One-time rebuild from the full log
+            _last_backups = {}
+            for entry in load_backup_log():
+                if entry.get('router_id'):
+                    _last_backups[entry['router_id']] = entry
+            _save_last_backups()
+    return _last_backups
+
+
+def _save_last_backups():
+    _atomic_write(config.LAST_BACKUPS_FILE, orjson.dumps(_last_backups))
+
+
+def get_last_backups():
+    """Get the most recent backup log entry for each router, keyed by router id."""
+    with _log_lock:
+        return dict(_get_last_backups())
+
+
+def forget_last_backup(router_id):
+    """Drop a router's entry from the latest-backup index (e.g. when the router is deleted)."""
+    with _log_lock:
+        if _get_last_backups().pop(router_id, None) is not None:
+            _save_last_backups()
+
+
+def migrate_backup_log():
+    """Convert a backup log in the old JSON array format to JSON Lines (one-shot)."""
+    if not os.path.exists(config.LEGACY_BACKUP_LOG_FILE) or os.path.exists(config.BACKUP_LOG_FILE):
+        return
+
+    with open(config.LEGACY_BACKUP_LOG_FILE, 'rb') as f:
+        log = orjson.loads(f.read())
     save_backup_log(log)
+    os.remove(config.LEGACY_BACKUP_LOG_FILE)
+    print(f"[Scheduler] Migrated {len(log)} backup log entries to {config.BACKUP_LOG_FILE}")
+
+
+def _file_digest(path):
+    """
+    SHA-256 of a backup file's contents.
+
+    An .rsc export starts with a comment line holding the export time, which is
+    left out so unchanged configurations hash the same.
+    """
+    with open(path, 'rb') as f:
+        if path.endswith('.rsc') and f.peek(1)[:1] == b'#':
+            f.readline()
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+def _get_upload_hashes():
+    """Return the last-upload dict, loading it on first use. Hold _upload_hashes_lock."""
+    global _upload_hashes
+    if _upload_hashes is None:
+        try:
+            with open(config.UPLOAD_HASHES_FILE, 'rb') as f:
+                _upload_hashes = orjson.loads(f.read())
+        except FileNotFoundError:
+            _upload_hashes = {}
+    return _upload_hashes
+
+
+def _save_upload_hashes():
+    with _upload_hashes_lock:
+        _atomic_write(config.UPLOAD_HASHES_FILE, orjson.dumps(_get_upload_hashes()))
+
+
+def backup_router(router, folder_id, delete_local, gdrive_authorized, triggered_by):
+    """
+    Back up one router and upload its files to Google Drive.
+
+    Returns:
+        tuple: (log entry, list of old Drive backup files to delete)
+    """
+    from utils.backup import create_backup
+    from utils.gdrive import gdrive_client
+
+    print(f"[Backup] Backing up {router.get('name', router.get('ip'))}")
+
+    result = create_backup(router)
+    log_entry = result.to_dict()
+    log_entry['triggered_by'] = triggered_by
+    old_backups = []
+
+    # Upload to Google Drive if authorized
+    if result.success and result.local_files and gdrive_authorized:
+        drive_files = []
+        drive_errors = []
+
+        # Skip files identical to the last ones uploaded for this router, as long as
+        # that upload is still in Drive; the log entry then points at the earlier file
+        with _upload_hashes_lock:
+            last_uploads = dict(_get_upload_hashes().get(result.router_id, {}))
+        digests = {}
+        unchanged = {}
+        to_upload = []
+        for local_file in result.local_files:
+            ext = os.path.splitext(local_file)[1]
+            digests[local_file] = _file_digest(local_file)
+            last = last_uploads.get(ext, {})
+            if last.get('sha256') == digests[local_file] and last.get('folder_id') == folder_id:
+                success, exists = gdrive_client.file_exists(last['id'])
+                if success and exists:
+                    unchanged[local_file] = last
+                    continue
+            to_upload.append(local_file)
+
+        uploaded = dict(zip(to_upload, gdrive_client.upload_files(to_upload, folder_id)))
+
+        # Drive files are listed in the same order as local_files
+        for local_file in result.local_files:
+            if local_file in unchanged:
+                last = unchanged[local_file]
+                drive_files.append({'id': last['id'], 'name': last.get('name'), 'link': last.get('link')})
+                log_entry.setdefault('drive_unchanged', []).append(os.path.basename(local_file))
+                print(f"[Backup] Unchanged, skipped upload: {os.path.basename(local_file)}")
+            else:
+                success, drive_result = uploaded[local_file]
+                if not success:
+                    drive_errors.append(drive_result)
+                    print(f"[Backup] Drive upload failed: {drive_result}")
+                    continue
+
+                drive_files.append({
+                    'id': drive_result.get('id'),
+                    'name': drive_result.get('name'),
+                    'link': drive_result.get('link')
+                })
+                last_uploads[os.path.splitext(local_file)[1]] = {
+                    'sha256': digests[local_file],
+                    **drive_files[-1],
+                    'folder_id': folder_id
+                }
+                print(f"[Backup] Uploaded to Drive: {drive_result.get('name')}")
+
+            # Delete local file if configured
+            if delete_local and os.path.exists(local_file):
+                os.remove(local_file)
+
+        if drive_files:
+            log_entry['drive_files'] = drive_files
+            with _upload_hashes_lock:
+                _get_upload_hashes()[result.router_id] = last_uploads
+
+            # Find old backups to delete from Drive; backup_routers() deletes them all in one batch
+            if result.identity:
+                success, files = gdrive_client.find_old_backups(result.identity, folder_id, keep_latest=12)
+                if success:
+                    old_backups = files
+
+        if drive_errors:
+            log_entry['drive_errors'] = drive_errors
+        if drive_files and delete_local:
+            log_entry['local_deleted'] = True
+
+    return log_entry, old_backups
+
+
+def backup_routers(routers, folder_id, delete_local, gdrive_authorized, triggered_by):
+    """
+    Back up routers concurrently, log the results and clean up their old Drive backups.
+
+    Returns:
+        tuple: (log entries of the routers backed up, number of routers whose backup raised)
+    """
+    from utils.gdrive import gdrive_client
+
+    log_entries = []
+    old_backups = []
+    failed = 0
+
+    # Each backup is dominated by network I/O, so run the routers concurrently
+    with ThreadPoolExecutor(max_workers=min(config.BACKUP_MAX_WORKERS, len(routers))) as executor:
+        futures = {
+            executor.submit(backup_router, router, folder_id, delete_local,
+                            gdrive_authorized, triggered_by): router
+            for router in routers
+        }
+        for future in as_completed(futures):
+            try:
+                log_entry, router_old_backups = future.result()
+            except Exception as e:
+                router = futures[future]
+                print(f"[Backup] Backup failed for {router.get('name', router.get('ip'))}: {e}")
+                failed += 1
+                continue
+
+            log_entries.append(log_entry)
+            old_backups.extend(router_old_backups)
+
+    # Write the whole run's log entries at once rather than one write per router
+    add_log_entries(log_entries)
+    _save_upload_hashes()
+
+    # Files standing in for skipped unchanged uploads are kept, whichever router's
+    # cleanup found them (routers can share an identity)
+    with _upload_hashes_lock:
+        stand_in_ids = {upload['id'] for uploads in _get_upload_hashes().values() for upload in uploads.values()}
+    old_backups = [file for file in old_backups if file['id'] not in stand_in_ids]
+
+    # Clean up old Drive backups for every router with one batch request
+    if old_backups:
+        success, deleted = gdrive_client.delete_files([file['id'] for file in old_backups])
+        if success:
+            print(f"[Backup] Cleaned up {len(deleted)} old backup(s) from Drive")
+        else:
+            print(f"[Backup] Drive cleanup failed: {deleted}")
+
+    return log_entries, failed
 
 
 def scheduled_backup_job():
@@ -64,7 +500,6 @@ def scheduled_backup_job():
     Job function to backup all routers.
     This runs within the Flask app context.
     """
-    from utils.backup import create_backup
     from utils.gdrive import gdrive_client
 
     print(f"[Scheduler] Starting scheduled backup at {datetime.now().isoformat()}")
@@ -80,51 +515,7 @@ def scheduled_backup_job():
     delete_local = settings.get('delete_local_after_upload', False)
     gdrive_authorized = gdrive_client.is_authorized()
 
-    for router in routers:
-        print(f"[Scheduler] Backing up {router.get('name', router.get('ip'))}")
-
-        result = create_backup(router)
-        log_entry = result.to_dict()
-        log_entry['triggered_by'] = 'scheduler'
-
-        # Upload to Google Drive if authorized
-        if result.success and result.local_files and gdrive_authorized:
-            drive_files = []
-            drive_errors = []
-            for local_file in result.local_files:
-                success, drive_result = gdrive_client.upload_file(local_file, folder_id)
-                if success:
-                    drive_files.append({
-                        'id': drive_result.get('id'),
-                        'name': drive_result.get('name'),
-                        'link': drive_result.get('link')
-                    })
-                    print(f"[Scheduler] Uploaded to Drive: {drive_result.get('name')}")
-
-                    # Delete local file if configured
-                    if delete_local and os.path.exists(local_file):
-                        os.remove(local_file)
-                else:
-                    drive_errors.append(drive_result)
-                    print(f"[Scheduler] Drive upload failed: {drive_result}")
-
-            if drive_files:
-                log_entry['drive_files'] = drive_files
-
-                # Delete old backups from Drive after successful upload
-                if result.local_files:
-                    filename = os.path.basename(result.local_files[0])
-                    router_identity = '-'.join(filename.split('-')[:-1])
-                    if router_identity:
-                        gdrive_client.delete_old_backups(router_identity, folder_id, keep_latest=12)
-                        print(f"[Scheduler] Cleaned up old backups for {router_identity}")
-
-            if drive_errors:
-                log_entry['drive_errors'] = drive_errors
-            if drive_files and delete_local:
-                log_entry['local_deleted'] = True
-
-        add_log_entry(log_entry)
+    backup_routers(routers, folder_id, delete_local, gdrive_authorized, 'scheduler')
 
     print(f"[Scheduler] Backup job completed at {datetime.now().isoformat()}")
 
@@ -132,7 +523,18 @@ def scheduled_backup_job():
 def update_scheduler(app):
     """
     Update the scheduler based on current settings.
+
+    Does nothing if the settings file hasn't changed since the job was last scheduled.
     """
+    global _scheduled_settings_mtime
+    try:
+        mtime = os.stat(config.SETTINGS_FILE).st_mtime_ns
+    except FileNotFoundError:
+        mtime = 0
+    if mtime == _scheduled_settings_mtime:
+        return
+    _scheduled_settings_mtime = mtime
+
     settings = load_settings()
 
     # Remove existing job if it exists
@@ -170,6 +572,7 @@ def update_scheduler(app):
 
 def init_scheduler(app):
     """Initialize the scheduler with the Flask app."""
+    migrate_backup_log()
     scheduler.init_app(app)
     scheduler.start()
     update_scheduler(app)
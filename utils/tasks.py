@@ -0,0 +1,71 @@
+"""
+Background Task Runner
+Runs long operations (backups) off the request thread and tracks their status
+"""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import uuid
+
+# How many tasks to remember for status polling
+MAX_TASKS = 100
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='task')
+_tasks = {}
+_tasks_lock = threading.Lock()
+
+
+def submit(func, *args):
+    """
+    Run func(*args) in the background.
+
+    func should return a list of (message, category) tuples describing the outcome.
+
+    Returns:
+        str: task id for get_task()
+    """
+    task_id = uuid.uuid4().hex
+
+    with _tasks_lock:
+        _tasks[task_id] = {'status': 'running', 'messages': []}
+
+        # Forget the oldest finished tasks
+        finished = [tid for tid, task in _tasks.items() if task['status'] != 'running']
+        for tid in finished[:max(len(_tasks) - MAX_TASKS, 0)]:
+            del _tasks[tid]
+
+    _executor.submit(_run, task_id, func, args)
+    return task_id
+
+
+def _run(task_id, func, args):
+    try:
+        messages = func(*args)
+        status = 'done'
+    except Exception as e:
+        messages = [(f'Task failed: {str(e)}', 'error')]
+        status = 'failed'
+
+    with _tasks_lock:
+        _tasks[task_id] = {'status': status, 'messages': messages}
+
+
+def get_task(task_id):
+    """
+    Get the status of a task.
+
+    Returns:
+        dict with keys: status ('running', 'done' or 'failed'), messages; or None if unknown
+    """
+    with _tasks_lock:
+        task = _tasks.get(task_id)
+        return dict(task) if task else None
+
+
+def pop_messages(task_id):
+    """Return a finished task's messages once, so they are only reported one time."""
+    with _tasks_lock:
+        task = _tasks.get(task_id)
+        if not task or task['status'] == 'running':
+            return []
+        messages, task['messages'] = task['messages'], []
+        return messages